@@ -1,20 +1,15 @@
 """Contains shortcuts for retrieving data from the blizzard API
 
-It is expected that you create an oauth class and retrieve a token using `requests_oauthlib` first
-to be able to request data
+It is expected that you create an oauth session with a token first to be able to request data.
+`get_cached_oauth_session` does this, reusing the token until it expires.
+Create one session and reuse it for everything so that connections to the API are pooled
 e.g.:
 ``` python
-from oauthlib.oauth2 import BackendApplicationClient
-from requests_oauthlib import OAuth2Session
 import blizzapi
 
 # you'll have to input your own CLIENT_ID and CLIENT_SECRET from the API
-TOKEN_URL = "https://oauth.battle.net/token"
-
 # set up oauth and get token
-client = BackendApplicationClient(client_id=CLIENT_ID)
-oauth = OAuth2Session(client=client, state="blah123")
-token = oauth.fetch_token(token_url=TOKEN_URL, client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
+oauth = blizzapi.get_cached_oauth_session(CLIENT_ID, CLIENT_SECRET)
 
 expansion = "The War Within"
 raid = "Nerub-ar Palace"
@@ -50,21 +45,48 @@ batch_data.get_equipment_df()
 """
 
 from __future__ import annotations
+import os
+import re
 import time
+import asyncio
+import functools
+import hashlib
+import threading
 from datetime import date
 from datetime import timedelta
 from calendar import WEDNESDAY
 import warnings
+from collections.abc import Callable
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+import aiohttp
+import orjson
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from oauthlib.oauth2 import BackendApplicationClient
 from requests_oauthlib import OAuth2Session
 import polars as pl
 
 REGION = "eu"
 LANG = "en_GB"
+TOKEN_URL = "https://oauth.battle.net/token"
+TOKEN_EXPIRY_MARGIN = 30 # refetch tokens this many seconds before they actually expire
+TOKEN_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "nop-raid-bot", "token.json")
+STATIC_REFRESH_TIME = 86400 # journal data only changes with game patches so re-query daily at most
+PROFILE_CACHE_SIZE = 1024 # most recently used profile responses kept, two per character
 
 COL_CHAR = "CharacterName-RealmName"
 
-ENCHANT_SLOTS = [
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_WORKERS = 8
+
+ENCHANT_SLOTS = (
     "Back",
     "Chest",
     "Wrist",
@@ -74,7 +96,7 @@ ENCHANT_SLOTS = [
     "Ring 2",
     "Main Hand",
     "Off Hand"
-]
+)
 GEM_TERTIARY = {
     "Head": 1,
     "Wrist": 1,
@@ -85,17 +107,66 @@ GEM_SETTING = {
     "Ring 1": 2,
     "Ring 2": 2,
 }
+GEM_SLOTS = GEM_TERTIARY | GEM_SETTING
+# gem column names for each slot, one per expected socket
+GEM_COLUMNS = {
+    item_slot: tuple(
+        f"{item_slot} gem{f' {socket_num + 1}' if sockets_expected > 1 else ''}"
+        for socket_num in range(sockets_expected)
+    )
+    for item_slot, sockets_expected in GEM_SLOTS.items()
+}
+# every column an equipment table can contain, in display order
+EQUIPMENT_COLUMNS = ENCHANT_SLOTS + tuple(
+    gem_column
+    for gem_columns in GEM_COLUMNS.values()
+    for gem_column in gem_columns
+)
 MISSING_ITEM_STR = "No Item"
 MISSING_ENCHANT_STR = "Missing Enchant"
 MISSING_GEM_STR = "Missing Gem"
 MISSING_SOCKET_STR = "Missing Socket"
+# quality icons as they show up in the json response mapped to the discord emotes in the No Pressure server
+QUALITY_ICONS = {
+    "|A:Professions-ChatIcon-Quality-Tier3:20:20|a": ":quality3:",
+    "|A:Professions-ChatIcon-Quality-Tier2:20:20|a": ":quality2:",
+    "|A:Professions-ChatIcon-Quality-Tier1:20:20|a": ":quality1:",
+}
+QUALITY_ICON_PREFIX = "|A:Professions-ChatIcon-Quality-Tier"
+_QUALITY_ICON_RE = re.compile("|".join(re.escape(icon) for icon in QUALITY_ICONS))
+
+_token_cache: dict[str, tuple[dict, float]] = {}
+_token_cache_lock = threading.Lock()
+_static_json_cache: dict[str, tuple[float, dict]] = {}
+_raid_encounters_cache: dict[tuple[str, str], tuple[float, list[str]]] = {}
+_profile_json_cache: dict[str, tuple[float, dict, dict[str, str]]] = {}
+_profile_json_cache_lock = threading.Lock()
 
 class CharacterNotFoundError(Exception):
     pass
 
+class _PooledAdapter(HTTPAdapter):
+    """Marks sessions which have already been configured by `_mount_pooled_adapter`
+    """
+
 class BlizzardAPIURLs:
     """Provides shortcuts to Blizz API URLs
     """
+    __slots__ = (
+        "hostname",
+        "profile_user",
+        "profile_char",
+        "profile_guild",
+        "journal_instance",
+        "locale",
+        "namespace_profile",
+        "namespace_static",
+        "urlend_profile",
+        "urlend_static",
+        "_char_prefix",
+        "_char_cache",
+    )
+
     def __init__(
             self,
             region: str = REGION,
@@ -107,14 +178,23 @@ class BlizzardAPIURLs:
         self.profile_guild = "/profile/wow/guild"
         self.journal_instance = "/data/wow/journal-instance"
         self.locale = f"locale={locale}"
-        self.namespace_profile = "namespace=profile-eu"
-        self.namespace_static = "namespace=static-eu"
-        self.urlend_profile = f"?{self.locale}&{self.namespace_profile}"
-        self.urlend_static = f"?{self.locale}&{self.namespace_static}"
+        self.namespace_profile = f"namespace=profile-{region}"
+        self.namespace_static = f"namespace=static-{region}"
+        self.urlend_profile = self._urlend(self.namespace_profile)
+        self.urlend_static = self._urlend(self.namespace_static)
+        self._char_prefix = f"{self.hostname}{self.profile_char}"
+        self._char_cache: dict[Character, str] = {}
 
     # --- base request
+    def _urlend(self, namespace: str):
+        return f"?{self.locale}&{namespace}"
+
     def _char(self, char: Character):
-        return f"{self.hostname}{self.profile_char}/{char.realm.lower()}/{char.name.lower()}"
+        char_url = self._char_cache.get(char)
+        if char_url is None:
+            char_url = f"{self._char_prefix}/{char.realm.lower()}/{char.name.lower()}"
+            self._char_cache[char] = char_url
+        return char_url
 
     def _journal(self):
         return f"{self.hostname}{self.journal_instance}"
@@ -138,7 +218,7 @@ class BlizzardAPIURLs:
         return f"{self._journal()}/{id}{self.urlend_static}"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Character:
     name: str
     realm: str
@@ -149,7 +229,12 @@ class Character:
 
 class BatchData:
     """Gathers multiple characters data
+
+    The same oauth session is shared by every character added, so all requests
+    reuse its pooled keep-alive connections rather than opening new ones
     """
+    __slots__ = ("urls", "oauth", "chars", "_char_set")
+
     def __init__(
             self,
             oauth: OAuth2Session,
@@ -158,16 +243,169 @@ class BatchData:
         if blizz_api_urls is None:
             blizz_api_urls = BlizzardAPIURLs()
         self.urls = blizz_api_urls
-        self.oauth = oauth
+        self.oauth = _mount_pooled_adapter(oauth)
         self.chars: list[CharacterData] = []
+        self._char_set: set[tuple[str, str]] = set()
 
     def add_chars(self, chars: list[Character]):
         for char in chars:
             self.add_char(char)
 
     def add_char(self, char: Character):
-        if char not in self.chars:
-            self.chars.append(CharacterData(char, self.oauth, self.urls))
+        # the API is case insensitive, so "Apto-Draenor" and "apto-draenor" are the same character
+        char_key = (char.name.lower(), char.realm.lower())
+        if char_key not in self._char_set:
+            self._char_set.add(char_key)
+            self.chars.append(self.character_data(char))
+
+    def character_data(self, char: Character) -> CharacterData:
+        """Creates a CharacterData for the character using the shared session and urls
+        """
+        return CharacterData(char, self.oauth, self.urls)
+
+    def _fetch_all(
+            self,
+            fetch: Callable[[CharacterData], dict],
+            max_workers: int = MAX_WORKERS,
+    ) -> dict[str, dict]:
+        """Runs a json fetch for every character concurrently
+
+        Args:
+            fetch: Function retrieving a json for a single character
+            max_workers: Maximum number of requests in flight at once
+
+        Returns:
+            Dictionary of character string to json
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(fetch, self.chars)
+            return {str(char): result for char, result in zip(self.chars, results)}
+
+    def fetch_all_raids(
+            self,
+            max_workers: int = MAX_WORKERS,
+    ) -> dict[str, dict]:
+        """Retrieves raid data for all characters concurrently, populating each character's cache
+
+        Args:
+            max_workers: Maximum number of requests in flight at once
+
+        Returns:
+            Dictionary of character string to raid json
+        """
+        return self._fetch_all(CharacterData._get_raid_json, max_workers)
+
+    def fetch_all_equipment(
+            self,
+            max_workers: int = MAX_WORKERS,
+    ) -> dict[str, dict]:
+        """Retrieves equipment data for all characters concurrently, populating each character's cache
+
+        Args:
+            max_workers: Maximum number of requests in flight at once
+
+        Returns:
+            Dictionary of character string to equipment json
+        """
+        return self._fetch_all(CharacterData._get_equipment_json, max_workers)
+
+    async def prefetch_async(
+            self,
+            raids: bool = True,
+            equipment: bool = True,
+            max_connections: int = MAX_WORKERS,
+    ) -> None:
+        """Retrieves character data concurrently on the running event loop, populating each character's cache
+
+        For use from async code (e.g. the discord bot) where the blocking requests made
+        by the synchronous methods would stall the event loop. Responses which are still
+        fresh in the cache are skipped and stale ones are revalidated. Characters found
+        not to exist are marked as such and are not requested again
+
+        Args:
+            raids: Whether to fetch raid data
+            equipment: Whether to fetch equipment data
+            max_connections: Maximum number of requests in flight at once
+        """
+        now = time.monotonic()
+        fetches = []
+        for char in self.chars:
+            if char._exists_result is False:
+                continue
+            urls = []
+            if raids:
+                urls.append(char.raids_url)
+            if equipment:
+                urls.append(char.equipment_url)
+            for url in urls:
+                cached = char._get_cached_json(url)
+                if cached is None or now - cached[0] >= char.refresh_time:
+                    fetches.append((char, url, cached))
+        if not fetches:
+            return
+        headers = {"Authorization": f"Bearer {self.oauth.token['access_token']}"}
+        connector = aiohttp.TCPConnector(limit=max_connections)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            headers=headers,
+            raise_for_status=True
+        ) as session:
+            results = await asyncio.gather(
+                *[
+                    _get_json_async(session, url, cached[2] if cached is not None else {})
+                    for _, url, cached in fetches
+                ],
+                return_exceptions=True
+            )
+        for (char, url, cached), result in zip(fetches, results):
+            if isinstance(result, aiohttp.ClientResponseError) and result.status == 404:
+                char._exists_result = False
+            elif isinstance(result, Exception):
+                warnings.warn(f"Failed to retrieve {url} for {char}: {result}")
+            elif result is None:
+                char._store_json(url, cached[1], cached[2])
+            else:
+                char._store_json(url, *result)
+
+    def raids_df(
+            self
+    ) -> pl.DataFrame:
+        """Gets every boss kill for the current character set as a single long table
+
+        Returns:
+            df with one row per character, expansion, instance, difficulty and encounter
+        """
+        raid_jsons = self.fetch_all_raids()
+        # existence is checked against the equipment json
+        self.fetch_all_equipment()
+        rows = [
+            (
+                char.name_realm,
+                expansion["expansion"]["name"],
+                instance["instance"]["name"],
+                mode["difficulty"]["name"],
+                encounter["encounter"]["name"],
+                encounter["last_kill_timestamp"],
+            )
+            for char in self.chars
+            if char.exists
+            for expansion in raid_jsons[str(char)].get("expansions", [])
+            for instance in expansion["instances"]
+            for mode in instance["modes"]
+            for encounter in mode["progress"]["encounters"]
+        ]
+        return pl.DataFrame(
+            rows,
+            schema={
+                COL_CHAR: pl.String,
+                "expansion": pl.String,
+                "instance": pl.String,
+                "difficulty": pl.String,
+                "encounter": pl.String,
+                "last_kill_timestamp": pl.Int64,
+            },
+            orient="row",
+        )
 
     def get_equipment_df(
             self
@@ -177,13 +415,22 @@ class BatchData:
         Returns:
             Table of equipment for all characters
         """
-        dataframes = []
-        for char in self.chars:
-            enchants = char._get_current_enchants_df()
-            gems = char._get_current_gems_df()
-            equipment = enchants.join(gems, on=[COL_CHAR])
-            dataframes.append(equipment)
-        df: pl.DataFrame = pl.concat(dataframes, how="diagonal_relaxed")
+        self.fetch_all_equipment()
+        rows = [
+            {
+                COL_CHAR: char.name_realm,
+                **char._get_current_enchants_dict(),
+                **char._get_current_gems_dict(),
+            }
+            for char in self.chars
+        ]
+        found_columns = set().union(*rows)
+        schema = {COL_CHAR: pl.String} | {
+            column: pl.String
+            for column in EQUIPMENT_COLUMNS
+            if column in found_columns
+        }
+        df = pl.DataFrame(rows, schema=schema)
         df = df.fill_null(MISSING_ITEM_STR)
         return df
 
@@ -196,16 +443,14 @@ class BatchData:
             Multiline string with code formatting of an equipment table
         """
         equipment_df = self.get_equipment_df()
-        for column in equipment_df.columns:
-            if column != COL_CHAR:
-                equipment_df = equipment_df.with_columns(
-                    pl.when(pl.col(column).is_in([MISSING_ITEM_STR, MISSING_SOCKET_STR]))
-                    .then(pl.lit("X"))
-                    .when(pl.col(column).is_in([MISSING_GEM_STR, MISSING_ENCHANT_STR]))
-                    .then(pl.lit("N"))
-                    .otherwise(pl.lit("Y"))
-                    .alias(column)
-                )
+        equipment_df = equipment_df.with_columns(
+            pl.when(pl.exclude(COL_CHAR).is_in([MISSING_ITEM_STR, MISSING_SOCKET_STR]))
+            .then(pl.lit("X"))
+            .when(pl.exclude(COL_CHAR).is_in([MISSING_GEM_STR, MISSING_ENCHANT_STR]))
+            .then(pl.lit("N"))
+            .otherwise(pl.lit("Y"))
+            .name.keep()
+        )
         initial_str_length = equipment_df.select(pl.col(COL_CHAR).str.len_chars()).max()[0,0]
         all_items = [item.split(" ") for item in equipment_df.columns if item != "CharacterName-RealmName"]
         max_sizes = []
@@ -225,12 +470,12 @@ class BatchData:
                     add_string = f"{' ' * (max_item_len + 1 - len(equipment_item[item_pieces_count]))}{equipment_item[item_pieces_count]}"
                     item_pieces_count += 1
                     headers[num] = f"{headers[num]} {add_string}"
-        print(headers)
         return_string = "Equipment summary (Y for enchanted/gemmed, N for not, X for missing entirely)\n```"
         for header in headers:
             return_string = f"{return_string}\n{header}"
+        char_rows = {row[0]: row for row in equipment_df.iter_rows()}
         for char in self.chars:
-            char_row = equipment_df.row(by_predicate=(pl.col(COL_CHAR) == str(char.char)))
+            char_row = char_rows[char.name_realm]
             char_string = f"{char_row[0]}"
             char_string = f"{char_string}{' ' * (initial_str_length - len(char_string))} {" ".join([f"{' ' * (max_item_len + 1 - len(item))}{item}" for item in char_row[1:]])}"
             return_string = f"{return_string}\n{char_string}"
@@ -272,6 +517,7 @@ class BatchData:
             expansion_name=expansion_name,
             raid_name=raid_name,
             oauth=self.oauth,
+            blizz_api_urls=self.urls,
         ).get_raid_encounters()
 
         basic_dict = {COL_CHAR: pl.String,}
@@ -280,28 +526,49 @@ class BatchData:
             for encounter
             in raid_encounters
         }
-        blank_df = pl.DataFrame(schema=basic_dict | encounters_dict)
 
-        dataframes = [blank_df]
-        for char in self.chars:
-            if report_type == progress_str:
-                dataframes.append(
-                    char._get_specific_raid_data_df(
-                        expansion_name=expansion_name,
-                        raid_name=raid_name,
-                        difficulty=difficulty
-                    )
-                )
-            elif report_type == lockout_str:
-                dataframes.append(
-                    char._get_specific_raid_lockout_status_df(
-                        expansion_name=expansion_name,
-                        raid_name=raid_name,
-                        difficulty=difficulty
-                    )
-                )
-        df: pl.DataFrame = pl.concat(dataframes, how="diagonal_relaxed")
-        df = df.fill_null(False)
+        kills = (
+            self.raids_df()
+            .lazy()
+            .filter(
+                (pl.col("expansion") == expansion_name)
+                & (pl.col("instance") == raid_name)
+                & (pl.col("difficulty") == difficulty)
+            )
+            .select(
+                COL_CHAR,
+                (pl.lit(f"{difficulty} ") + pl.col("encounter")).alias("encounter"),
+                (pl.col("last_kill_timestamp") // 1000).alias("last_kill"),
+            )
+            .collect()
+        )
+        char_names = [char.name_realm for char in self.chars]
+        killed_chars = set(kills[COL_CHAR])
+        for char_name in char_names:
+            if char_name not in killed_chars:
+                warnings.warn(f"No data found for {char_name} {raid_name} [{difficulty}]")
+
+        # pivot is only available eagerly, everything after it runs as one lazy query
+        chars_lf = pl.LazyFrame({COL_CHAR: char_names}, schema=basic_dict)
+        kill_columns = []
+        if kills.height > 0:
+            kills = kills.pivot(on="encounter", index=COL_CHAR, values="last_kill")
+            kill_columns = [column for column in kills.columns if column != COL_CHAR]
+            chars_lf = chars_lf.join(kills.lazy(), on=COL_CHAR, how="left")
+        if report_type == lockout_str:
+            chars_lf = chars_lf.with_columns(pl.col(kill_columns) > last_reset_time())
+        schema = basic_dict | encounters_dict | {column: col_dtype for column in kill_columns}
+        df = (
+            chars_lf
+            .select(
+                (pl.col(column) if column in kill_columns or column == COL_CHAR else pl.lit(None))
+                .cast(dtype)
+                .alias(column)
+                for column, dtype in schema.items()
+            )
+            .fill_null(False)
+            .collect()
+        )
         return df
 
     def get_raid_progress_summary(
@@ -330,19 +597,18 @@ class BatchData:
             difficulty=difficulty,
             report_type="progress"
         )
-        for column in raid_lockout_df.columns:
-            if column != COL_CHAR:
-                raid_lockout_df = raid_lockout_df.with_columns(
-                    pl.when(pl.col(column).is_null())
-                    .then(pl.lit("N"))
-                    .otherwise(pl.lit("Y"))
-                    .alias(column)
-                )
+        raid_lockout_df = raid_lockout_df.with_columns(
+            pl.when(pl.exclude(COL_CHAR).is_null())
+            .then(pl.lit("N"))
+            .otherwise(pl.lit("Y"))
+            .name.keep()
+        )
         initial_str_length = raid_lockout_df.select(pl.col(COL_CHAR).str.len_chars()).max()[0,0]
         bosses_numbers = "".join([f" {number + 1}" for number in range(len(raid_lockout_df.columns) - 1)])
         return_string = f"Raid Progress Summary for {raid_name} [{difficulty}] (Y if boss has been killed ever by this character)\n```{' ' * initial_str_length}{bosses_numbers}"
+        char_rows = {row[0]: row for row in raid_lockout_df.iter_rows()}
         for char in self.chars:
-            char_row = raid_lockout_df.row(by_predicate=(pl.col(COL_CHAR) == str(char.char)))
+            char_row = char_rows[char.name_realm]
             char_string = f"{char_row[0]}"
             char_string = f"{char_string}{' ' * (initial_str_length - len(char_string))} {" ".join([str(item) for item in char_row[1:]])}"
             return_string = f"{return_string}\n{char_string}"
@@ -378,8 +644,9 @@ class BatchData:
         initial_str_length = raid_lockout_df.select(pl.col(COL_CHAR).str.len_chars()).max()[0,0]
         bosses_numbers = "".join([f" {number + 1}" for number in range(len(raid_lockout_df.columns) - 1)])
         return_string = f"Raid Lockout Summary for {raid_name} [{difficulty}] (Y if boss has been killed this reset)\n```{' ' * initial_str_length}{bosses_numbers}"
+        char_rows = {row[0]: row for row in raid_lockout_df.iter_rows()}
         for char in self.chars:
-            char_row = raid_lockout_df.row(by_predicate=(pl.col(COL_CHAR) == str(char.char)))
+            char_row = char_rows[char.name_realm]
             char_string = f"{char_row[0]}"
             char_string = f"{char_string}{' ' * (initial_str_length - len(char_string))} {" ".join([str(item) for item in char_row[1:]]).replace("True", "Y").replace("False", "N")}"
             return_string = f"{return_string}\n{char_string}"
@@ -390,6 +657,8 @@ class BatchData:
 class RaidInfo:
     """Gets information about a raid
     """
+    __slots__ = ("urls", "oauth", "expansion", "raid")
+
     def __init__(
             self,
             expansion_name: str,
@@ -408,37 +677,74 @@ class RaidInfo:
             self
     ) -> list[str]:
         """Get a list of raid encounters for the raid based on the class info
+
+        The list is shared between all RaidInfo instances for the same raid for a day
         """
         encounters_url = self.urls.get_encounter_journal_index()
-        encounters_json = self.oauth.get(encounters_url).json()
+        cache_key = (encounters_url, self.raid)
+        cached = _raid_encounters_cache.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < STATIC_REFRESH_TIME:
+            return list(cached[1])
+        encounters_json = _get_static_json(self.oauth, encounters_url)
         encounters_dict = {item["name"]: item["id"] for item in encounters_json["instances"]}
         raid_id = encounters_dict[self.raid]
         raid_url = self.urls.get_encounter_list(raid_id)
-        raid_json = self.oauth.get(raid_url).json()
+        raid_json = _get_static_json(self.oauth, raid_url)
         encounters = [item["name"] for item in raid_json["encounters"]]
-        return encounters
+        _raid_encounters_cache[cache_key] = (time.monotonic(), encounters)
+        return list(encounters)
 
 class CharacterData:
     """Manages data gathering for a character
+
+    `oauth` should be a long-lived session shared between characters (see `BatchData`)
+    so that connections to the API are pooled rather than re-established per character
+
+    Responses are cached in `json_cache`, which defaults to a module level cache shared
+    by every character so repeated lookups of the same character reuse the response
     """
+    __slots__ = (
+        "char",
+        "name_realm",
+        "urls",
+        "raids_url",
+        "equipment_url",
+        "oauth",
+        "refresh_time",
+        "_json_cache",
+        "_raid_index",
+        "_raid_index_source",
+        "_raid_data_cache",
+        "_equipped_index",
+        "_equipped_index_source",
+        "_exists_result",
+    )
+
     def __init__(
             self,
             char: Character,
             oauth: OAuth2Session,
             blizz_api_urls: BlizzardAPIURLs = None,
+            json_cache: dict[str, tuple[float, dict, dict[str, str]]] | None = None,
     ):
         if blizz_api_urls is None:
             blizz_api_urls = BlizzardAPIURLs()
+        if json_cache is None:
+            json_cache = _profile_json_cache
         self.char: Character = char
+        self.name_realm = f"{char.name}-{char.realm}"
         self.urls = blizz_api_urls
+        self.raids_url = blizz_api_urls.get_raids(char)
+        self.equipment_url = blizz_api_urls.get_equipment(char)
         self.oauth = oauth
         self.refresh_time = 300 # don't re-query data if it's been less than 5 minutes
-        self.raid_json = None
-        self.raid_json_time = None
-        self.equipment_json = None
-        self.equipment_json_time = None
-        self.df_enchants = self._blank_df()
-        self.exists = self._exists()
+        self._json_cache = json_cache
+        self._raid_index: dict[str, dict[str, dict[str, dict]]] | None = None
+        self._raid_index_source: dict | None = None
+        self._raid_data_cache: dict[tuple[str, str, str], dict[str, int]] = {}
+        self._equipped_index: dict[str, dict] | None = None
+        self._equipped_index_source: dict | None = None
+        self._exists_result: bool | None = None
 
     def __str__(
             self
@@ -447,45 +753,148 @@ class CharacterData:
 
     # --- Retrieve jsons
 
+    def _get_json(
+        self,
+        url: str,
+    ) -> dict:
+        """Retrieves a json from the API, reusing the cached response if it is recent enough
+
+        Once the cached response is too old it is revalidated with a conditional request,
+        so unchanged data is not downloaded again. Only successful responses are cached;
+        if the request fails or returns an error status and an older response is cached,
+        the stale response is returned instead of raising. Not found responses are
+        returned uncached so that missing characters can be detected
+
+        Args:
+            url: Full url of the API endpoint
+        """
+        cached = self._get_cached_json(url)
+        if cached is not None and time.monotonic() - cached[0] < self.refresh_time:
+            return cached[1]
+        request_headers = cached[2] if cached is not None else {}
+        try:
+            response = self.oauth.get(url, headers=request_headers)
+            if response.status_code == 304 and cached is not None:
+                self._store_json(url, cached[1], cached[2])
+                return cached[1]
+            if response.status_code == 404:
+                return orjson.loads(response.content)
+            response.raise_for_status()
+            json_data = orjson.loads(response.content)
+        except (RequestException, orjson.JSONDecodeError):
+            if cached is None:
+                raise
+            warnings.warn(f"Request failed for {self.char}, using cached data")
+            return cached[1]
+        self._store_json(url, json_data, _conditional_headers(response.headers))
+        return json_data
+
+    def _store_json(
+        self,
+        url: str,
+        json_data: dict,
+        request_headers: dict[str, str] | None = None,
+    ):
+        """Stores a retrieved json in the cache, dropping the least recently used
+        responses once the cache holds more than `PROFILE_CACHE_SIZE`
+
+        Args:
+            url: Full url of the API endpoint
+            json_data: Parsed response from the endpoint
+            request_headers: Headers to revalidate the response with once it is stale
+        """
+        with _profile_json_cache_lock:
+            self._json_cache.pop(url, None)
+            self._json_cache[url] = (time.monotonic(), json_data, request_headers or {})
+            while len(self._json_cache) > PROFILE_CACHE_SIZE:
+                del self._json_cache[next(iter(self._json_cache))]
+
+    def _get_cached_json(
+        self,
+        url: str,
+    ) -> tuple[float, dict, dict[str, str]] | None:
+        """Retrieves a cached response, marking it as recently used
+
+        Args:
+            url: Full url of the API endpoint
+
+        Returns:
+            Time the response was stored, the parsed json and its revalidation headers
+        """
+        with _profile_json_cache_lock:
+            cached = self._json_cache.pop(url, None)
+            if cached is not None:
+                self._json_cache[url] = cached
+        return cached
+
     def _get_raid_json(
         self
-    ) -> str:
+    ) -> dict:
         """Retrieves a relevant json containing raid data for the character
         """
-        if (
-            self.raid_json is None
-            or self.raid_json_time > time.mktime(time.gmtime()) + self.refresh_time
-        ):
-            url = self.urls.get_raids(self.char)
-            self.raid_json = self.oauth.get(url).json()
-            self.raid_json_time = time.mktime(time.gmtime())
-        return self.raid_json
+        return self._get_json(self.raids_url)
+
+    def _get_raid_index(
+        self
+    ) -> dict[str, dict[str, dict[str, dict]]]:
+        """Retrieves raid progress as nested dicts of expansion -> instance -> difficulty -> progress
+
+        The index is rebuilt only when the underlying raid json has been re-queried
+        """
+        response = self._get_raid_json()
+        if response is not self._raid_index_source:
+            self._raid_index = {
+                expansion["expansion"]["name"]: {
+                    instance["instance"]["name"]: {
+                        mode["difficulty"]["name"]: mode["progress"]
+                        for mode in instance["modes"]
+                    }
+                    for instance in expansion["instances"]
+                }
+                for expansion in response.get("expansions", [])
+            }
+            self._raid_index_source = response
+            self._raid_data_cache = {}
+        return self._raid_index
 
     def _get_equipment_json(
         self
-    ) -> str:
+    ) -> dict:
         """Retrieves a relevant json containing equipment data for the character
         """
-        if (
-            self.equipment_json is None
-            or self.equipment_json_time > time.mktime(time.gmtime()) + self.refresh_time
-        ):
-            url = self.urls.get_equipment(self.char)
-            self.equipment_json = self.oauth.get(url).json()
-            self.equipment_json_time = time.mktime(time.gmtime())
-        return self.equipment_json
+        return self._get_json(self.equipment_url)
+
+    def _get_equipped_index(
+        self
+    ) -> dict[str, dict]:
+        """Retrieves equipped items as a dict of slot name -> item
+
+        The index is rebuilt only when the underlying equipment json has been re-queried
+        """
+        response = self._get_equipment_json()
+        if response is not self._equipped_index_source:
+            self._equipped_index = {
+                item["slot"]["name"]: item
+                for item in response["equipped_items"]
+            }
+            self._equipped_index_source = response
+        return self._equipped_index
 
     # --- Utilities
 
-    def _exists(self) -> str:
+    @property
+    def exists(self) -> bool:
+        """Whether the character exists, checked on first use so that creating
+        characters does not block on a request
+        """
+        if self._exists_result is None:
+            self._exists_result = self._exists()
+        return self._exists_result
+
+    def _exists(self) -> bool:
         return "character" in self._get_equipment_json()
             #raise CharacterNotFoundError("Could not retrieve valid equipment data for the character")
 
-    def _blank_df(self) -> pl.DataFrame:
-        """Creates a "blank" df, including char name and realm
-        """
-        return pl.DataFrame({COL_CHAR: [f"{self.char.name}-{self.char.realm}"]})
-
     def _format_unix_time(
             self,
             unix_time: int,
@@ -498,9 +907,9 @@ class CharacterData:
             discord_format: Whether to return the strings in discord time format
         """
         if discord_format:
-            return f"<t:{unix_time}:D>"
+            return _discord_time(unix_time)
         else:
-            return time.ctime(unix_time)
+            return _ctime(unix_time)
 
     def _populate_from_dict(
             self,
@@ -509,13 +918,15 @@ class CharacterData:
         """Converts a dict into a df with char name/realm included
 
         Args:
-            enchants: Dictionary of column to value
+            data_dict: Dictionary of column to value
 
         Returns:
             Polars dataframe with summary of dict
         """
-        df = self._blank_df()
-        return df.with_columns(**{key: pl.lit(value) for key, value in data_dict.items()})
+        return pl.DataFrame({
+            COL_CHAR: [self.name_realm],
+            **{key: [value] for key, value in data_dict.items()},
+        })
 
     # --- Raid progress
 
@@ -524,86 +935,88 @@ class CharacterData:
             raid_name: str = "",
             difficulty: str = "",
     ):
-        warnings.warn(f"No data found for {self.char.name}-{self.char.realm} {raid_name} [{difficulty}]")
-        return self._blank_df()
+        warnings.warn(f"No data found for {self.name_realm} {raid_name} [{difficulty}]")
+        return {}
 
-    def _get_specific_raid_data_df(
+    def _get_specific_raid_data_dict(
             self,
             expansion_name: str,
             raid_name: str,
             difficulty: str,
-    ) -> pl.DataFrame:
+    ) -> dict[str, int]:
         """Gets raid progress for a given raid & difficulty
 
+        Results are reused until the raid json is re-queried
+
         Args:
             expansion_name: Name of the expansion
             raid_name: Name of the relevant raid
             difficulty: Difficulty level of the given raid
 
         Returns:
-            df with a summary of progress
+            Dictionary of "difficulty encounter" to time of last kill
         """
         if not self.exists:
             return self._raid_data_none(raid_name, difficulty)
-        response = self._get_raid_json()
-        if "expansions" not in response:
+        raid_index = self._get_raid_index()
+        cache_key = (expansion_name, raid_name, difficulty)
+        cached = self._raid_data_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        char_raid_data = (
+            raid_index
+            .get(expansion_name, {})
+            .get(raid_name, {})
+            .get(difficulty)
+        )
+        if char_raid_data is None:
             return self._raid_data_none(raid_name, difficulty)
-        expansions_list = [
-            data["expansion"]["name"]
-            for data
-            in response["expansions"]
-        ]
-        if expansion_name in expansions_list:
-            exp_idx = expansions_list.index(expansion_name)
-            instances_list = [
-                data["instance"]["name"]
-                for data
-                in response["expansions"][exp_idx]["instances"]
-            ]
-            if raid_name in instances_list:
-                instance_idx = instances_list.index(raid_name)
-                difficulties_list = [
-                    data["difficulty"]["name"]
-                    for data
-                    in response["expansions"][exp_idx]["instances"][instance_idx]["modes"]
-                ]
-                if difficulty in difficulties_list:
-                    difficulty_index = difficulties_list.index(difficulty)
-                    char_raid_data = response["expansions"][exp_idx]["instances"][instance_idx]["modes"][difficulty_index]["progress"]
-                    return self._populate_from_dict(
-                        data_dict={
-                            f"{difficulty} {encounter["encounter"]["name"]}":
-                            int(str(encounter["last_kill_timestamp"])[:-3])
-                            for encounter in char_raid_data["encounters"]
-                        }
-                    )
-                else:
-                    return self._raid_data_none(raid_name, difficulty)
+        raid_data = {
+            f"{difficulty} {encounter["encounter"]["name"]}":
+            encounter["last_kill_timestamp"] // 1000
+            for encounter in char_raid_data["encounters"]
+        }
+        self._raid_data_cache[cache_key] = raid_data
+        return dict(raid_data)
+
+    def _get_specific_raid_data_df(
+            self,
+            expansion_name: str,
+            raid_name: str,
+            difficulty: str,
+    ) -> pl.DataFrame:
+        """Gets raid progress for a given raid & difficulty
+
+        Args:
+            expansion_name: Name of the expansion
+            raid_name: Name of the relevant raid
+            difficulty: Difficulty level of the given raid
+
+        Returns:
+            df with a summary of progress
+        """
+        return self._populate_from_dict(
+            data_dict=self._get_specific_raid_data_dict(expansion_name, raid_name, difficulty)
+        )
 
     def _raid_progress_report(
             self,
-            progress_df: pl.DataFrame,
+            progress: dict[str, int],
             discord_format = True,
     ) -> str:
         """Reformats the progress for the raid into a nice output string
 
         Args:
-            progress_df: Dataframe with a summary of progress
+            progress: Dictionary of "difficulty encounter" to time of last kill
             discord_format: Whether to format times as strings or discord strings
 
         Returns:
             string of progression, nicely formatted
         """
-        progress_str = None
-        for col in progress_df.columns:
-            if col not in [COL_CHAR]:
-                unix_time = progress_df.select(col)[0,0]
-                time_str = self._format_unix_time(unix_time, discord_format)
-                if progress_str is None:
-                    progress_str = f"- {col}: {time_str}"
-                else:
-                    progress_str = f"{progress_str}\n- {col}: {time_str}"
-        return progress_str
+        return "\n".join(
+            f"- {col}: {self._format_unix_time(unix_time, discord_format)}"
+            for col, unix_time in progress.items()
+        )
 
     def get_specific_raid_data(
             self,
@@ -623,13 +1036,13 @@ class CharacterData:
         Returns:
             string of progression, nicely formatted
         """
-        df = self._get_specific_raid_data_df(
+        progress = self._get_specific_raid_data_dict(
             expansion_name=expansion_name,
             raid_name=raid_name,
             difficulty=difficulty
         )
-        if df is not None:
-            return f"{self.char}:\n{self._raid_progress_report(df, discord_format=discord_format)}"
+        if progress:
+            return f"{self.char}:\n{self._raid_progress_report(progress, discord_format=discord_format)}"
         else:
             return f"{self.char}: No progress found"
 
@@ -654,21 +1067,7 @@ class CharacterData:
             raid_name=raid_name,
             difficulty=difficulty
         )
-        if len(df.columns) == 1:
-            return df
-        df = df.melt(id_vars=[COL_CHAR])
-        df = df.with_columns(
-            pl.col("value")
-            .map_elements(is_locked_out, return_dtype=pl.Boolean)
-            .alias("is_locked")
-        )
-        df = df.drop("value")
-        df = df.pivot(
-            values="is_locked",
-            index=[COL_CHAR],
-            columns="variable"
-        )
-        return df
+        return df.with_columns(pl.exclude(COL_CHAR) > last_reset_time())
 
     def get_specific_raid_lockout_status(
             self,
@@ -691,49 +1090,48 @@ class CharacterData:
             raid_name=raid_name,
             difficulty=difficulty
         )
-        relevant_cols = list(df.columns)
-        relevant_cols.remove(COL_CHAR)
-        return_string = f"{self.char.name}-{self.char.realm}:"
-        for col in relevant_cols:
-            return_string = f"{return_string}\n- {col}: {df.select(col)[0,0]}"
-        return return_string
+        lockouts = df.row(0, named=True)
+        lines = [f"{self.name_realm}:"]
+        lines.extend(
+            f"- {col}: {locked_out}"
+            for col, locked_out in lockouts.items()
+            if col != COL_CHAR
+        )
+        return "\n".join(lines)
 
     # --- Equipment
 
     def _equipment_data_none(
             self,
-    ) -> pl.DataFrame:
-        warnings.warn(f"No equipment found for {self.char.name}-{self.char.realm}")
-        return self._blank_df()
+    ) -> dict:
+        warnings.warn(f"No equipment found for {self.name_realm}")
+        return {}
 
-    def _get_current_enchants_df(
+    def _get_current_enchants_dict(
             self,
-    ) -> pl.DataFrame:
-        """Gets a dataframe of current enchants for the character
+    ) -> dict[str, str]:
+        """Gets a dictionary of enchant slot to current enchant for the character
         """
         if not self.exists:
             return self._equipment_data_none()
-        response = self._get_equipment_json()
-        enchant_slots = ENCHANT_SLOTS
-        equipped = [item["slot"]["name"] for item in response["equipped_items"]]
+        equipped = self._get_equipped_index()
         enchants = {}
-        for item_slot in enchant_slots:
-            if item_slot in equipped:
-                enchant_found = False
-                slot_idx = equipped.index(item_slot)
-                item_data = response["equipped_items"][slot_idx]
-                if "enchantments" in item_data:
-                    for enchant_type in item_data["enchantments"]:
-                        if enchant_type["enchantment_slot"]["type"] == "PERMANENT":
-                            enchant_idx = item_data["enchantments"].index(enchant_type)
-                            enchant_found = True
-                    if enchant_found:
-                        enchant = item_data["enchantments"][enchant_idx]["display_string"]
+        for item_slot in ENCHANT_SLOTS:
+            item_data = equipped.get(item_slot)
+            if item_data is not None:
+                permanent = next(
+                    (
+                        enchant_type
+                        for enchant_type in item_data.get("enchantments", ())
+                        if enchant_type["enchantment_slot"]["type"] == "PERMANENT"
+                    ),
+                    None
+                )
+                if permanent is not None:
+                    enchants[item_slot] = permanent["display_string"]
                 else:
-                    enchant = MISSING_ENCHANT_STR
-                enchants[item_slot] = enchant
-        enchants = _replace_quality_icons(enchants)
-        return self._populate_from_dict(data_dict=enchants)
+                    enchants[item_slot] = MISSING_ENCHANT_STR
+        return _replace_quality_icons(enchants)
 
     def get_current_enchants(
             self,
@@ -745,54 +1143,41 @@ class CharacterData:
             verbose: whether to report on missing slots
         """
         if not self.exists:
-            return_string = f"{self.char.name}-{self.char.realm} does not exist"
-        else:
-            return_string = f"{self.char.name}-{self.char.realm} Enchants:"
-
-        enchants_df = self._get_current_enchants_df()
-        equipment_cols = list(enchants_df.columns)
-        equipment_cols.remove(COL_CHAR)
-        for item_slot in enchants_df.select(equipment_cols).columns:
-            if enchants_df.select(item_slot)[0,0] == MISSING_ENCHANT_STR:
-                return_string = f"{return_string}\n- {item_slot}: {MISSING_ENCHANT_STR}"
+            return f"{self.name_realm} does not exist"
+        lines = [f"{self.name_realm} Enchants:"]
+
+        enchants = self._get_current_enchants_dict()
+        for item_slot, enchant in enchants.items():
+            if enchant == MISSING_ENCHANT_STR:
+                lines.append(f"- {item_slot}: {MISSING_ENCHANT_STR}")
             elif verbose:
-                return_string = f"{return_string}\n- {item_slot}: {enchants_df.select(item_slot)[0,0]}"
+                lines.append(f"- {item_slot}: {enchant}")
 
-        if return_string == f"{self.char.name}-{self.char.realm} Enchants:":
-            return_string = f"{self.char.name}-{self.char.realm} has no missing enchants"
-        return return_string
+        if len(lines) == 1:
+            return f"{self.name_realm} has no missing enchants"
+        return "\n".join(lines)
 
-    def _get_current_gems_df(
+    def _get_current_gems_dict(
             self
-    ) -> pl.DataFrame:
-        """Gets a dataframe of current gems for the character
+    ) -> dict[str, str]:
+        """Gets a dictionary of gem socket to current gem for the character
         """
         if not self.exists:
             return self._equipment_data_none()
-        response = self._get_equipment_json()
-        gem_slots = GEM_TERTIARY | GEM_SETTING
-        equipped = [item["slot"]["name"] for item in response["equipped_items"]]
+        equipped = self._get_equipped_index()
         gems = {}
-        for item_slot, sockets_expected in gem_slots.items():
-            if item_slot in equipped:
-                slot_idx = equipped.index(item_slot)
-                item_data = response["equipped_items"][slot_idx]
-                for socket_num in range(sockets_expected):
-                    if sockets_expected > 1:
-                        socket_num_str = f" {socket_num + 1}"
+        for item_slot, gem_columns in GEM_COLUMNS.items():
+            item_data = equipped.get(item_slot)
+            if item_data is not None:
+                sockets = item_data.get("sockets", ())
+                for socket_num, gem_column in enumerate(gem_columns):
+                    if socket_num >= len(sockets):
+                        gems[gem_column] = MISSING_SOCKET_STR
+                    elif "item" not in sockets[socket_num]:
+                        gems[gem_column] = MISSING_GEM_STR
                     else:
-                        socket_num_str = ""
-                    if "sockets" not in item_data:
-                        gems[f"{item_slot} gem{socket_num_str}"] = MISSING_SOCKET_STR
-                    elif socket_num + 1 > len(item_data["sockets"]):
-                        gems[f"{item_slot} gem{socket_num_str}"] = MISSING_SOCKET_STR
-                    elif "item" not in item_data["sockets"][socket_num]:
-                        gems[f"{item_slot} gem{socket_num_str}"] = MISSING_GEM_STR
-                    else:
-                        gems[f"{item_slot} gem{socket_num_str}"] = (
-                            item_data["sockets"][socket_num]["item"]["name"])
-        gems = _replace_quality_icons(gems)
-        return self._populate_from_dict(data_dict=gems)
+                        gems[gem_column] = sockets[socket_num]["item"]["name"]
+        return _replace_quality_icons(gems)
 
     def get_current_gems(
             self,
@@ -804,25 +1189,19 @@ class CharacterData:
             verbose: whether to report on missing slots
         """
         if not self.exists:
-            return_string = f"{self.char.name}-{self.char.realm} does not exist"
-        else:
-            return_string = f"{self.char.name}-{self.char.realm} Gems:"
-
-        gems_df = self._get_current_gems_df()
-        equipment_cols = list(gems_df.columns)
-        equipment_cols.remove(COL_CHAR)
-        for item_slot in gems_df.select(equipment_cols).columns:
-            if (
-                gems_df.select(item_slot)[0,0] == MISSING_SOCKET_STR
-                or gems_df.select(item_slot)[0,0] == MISSING_GEM_STR
-            ):
-                return_string = f"{return_string}\n- {item_slot}: {gems_df.select(item_slot)[0,0]}"
+            return f"{self.name_realm} does not exist"
+        lines = [f"{self.name_realm} Gems:"]
+
+        gems = self._get_current_gems_dict()
+        for item_slot, gem in gems.items():
+            if gem == MISSING_SOCKET_STR or gem == MISSING_GEM_STR:
+                lines.append(f"- {item_slot}: {gem}")
             elif verbose:
-                return_string = f"{return_string}\n- {item_slot}: {gems_df.select(item_slot)[0,0]}"
+                lines.append(f"- {item_slot}: {gem}")
 
-        if return_string == f"{self.char.name}-{self.char.realm} Gems:":
-            return_string = f"{self.char.name}-{self.char.realm} has no missing gems"
-        return return_string
+        if len(lines) == 1:
+            return f"{self.name_realm} has no missing gems"
+        return "\n".join(lines)
 
 def is_locked_out(
         unix_time: int
@@ -835,17 +1214,214 @@ def is_locked_out(
     Returns:
         bool: True if time is after last reset (locked out), false if not
     """
+    return unix_time > last_reset_time()
+
+def last_reset_time() -> float:
+    """Gets the time of the most recent weekly reset
+
+    Returns:
+        Time of the last reset in unix seconds
+    """
+    return _last_reset_time(date.today().toordinal())
+
+@functools.lru_cache(maxsize=1)
+def _last_reset_time(
+        day_ordinal: int
+) -> float:
+    """Calculates the time of the most recent weekly reset as of the given day
+
+    Args:
+        day_ordinal: Proleptic Gregorian ordinal of the day, so the result is cached per day
+    """
     # offset GMT by an hour to get CET which is server time in EU
     server_offset = 3600
     # reset happens at 4am
     reset_hour_offset = 3600 * 4
-    today = date.today()
+    today = date.fromordinal(day_ordinal)
     offset = (today.weekday() - WEDNESDAY) % 7
     last_reset = time.mktime((today - timedelta(days=offset)).timetuple())
-    last_reset = last_reset + reset_hour_offset + server_offset
-    if unix_time > last_reset:
-        return True
-    return False
+    return last_reset + reset_hour_offset + server_offset
+
+@functools.lru_cache(maxsize=4096)
+def _discord_time(
+        unix_time: int
+) -> str:
+    return f"<t:{unix_time}:D>"
+
+@functools.lru_cache(maxsize=4096)
+def _ctime(
+        unix_time: int
+) -> str:
+    return time.ctime(unix_time)
+
+def get_cached_oauth_session(
+        client_id: str,
+        client_secret: str,
+        token_url: str = TOKEN_URL,
+        token_file: str | None = None,
+) -> OAuth2Session:
+    """Creates an oauth session, reusing a previously fetched token if it has not expired
+
+    If `token_file` is given, tokens are also saved to it so that they can be reused by
+    later runs (e.g. `TOKEN_CACHE_FILE` for command line use)
+
+    Args:
+        client_id: Client ID from the Blizzard API
+        client_secret: Client secret from the Blizzard API
+        token_url: URL to retrieve the token from
+        token_file: File to persist tokens in between runs, None to only cache in memory
+
+    Returns:
+        Session with a valid token attached
+    """
+    cache_key = hashlib.sha256(f"{token_url}|{client_id}|{client_secret}".encode()).hexdigest()
+    client = BackendApplicationClient(client_id=client_id)
+    cached = _token_cache.get(cache_key)
+    if cached is not None and time.time() < cached[1] - TOKEN_EXPIRY_MARGIN:
+        return OAuth2Session(client=client, token=cached[0])
+    with _token_cache_lock:
+        # another caller may have refreshed the token while we waited for the lock
+        cached = _token_cache.get(cache_key)
+        if cached is not None and time.time() < cached[1] - TOKEN_EXPIRY_MARGIN:
+            return OAuth2Session(client=client, token=cached[0])
+        if token_file is not None:
+            saved = _read_token_file(token_file).get(cache_key)
+            if saved is not None and time.time() < saved[1] - TOKEN_EXPIRY_MARGIN:
+                _token_cache[cache_key] = (saved[0], saved[1])
+                return OAuth2Session(client=client, token=saved[0])
+        oauth = OAuth2Session(client=client)
+        token = oauth.fetch_token(token_url=token_url, client_id=client_id, client_secret=client_secret)
+        expires = time.time() + token["expires_in"]
+        _token_cache[cache_key] = (token, expires)
+        if token_file is not None:
+            _write_token_file(token_file, cache_key, token, expires)
+    return oauth
+
+def _read_token_file(
+        token_file: str
+) -> dict[str, list]:
+    """Reads persisted tokens, returning nothing if the file is missing or unreadable
+
+    Args:
+        token_file: File tokens are persisted in
+    """
+    try:
+        with open(token_file, "rb") as file:
+            tokens = orjson.loads(file.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+    if not isinstance(tokens, dict):
+        return {}
+    return tokens
+
+def _write_token_file(
+        token_file: str,
+        cache_key: str,
+        token: dict,
+        expires: float,
+):
+    """Persists a token alongside any others already saved, readable only by the current user
+
+    Args:
+        token_file: File tokens are persisted in
+        cache_key: Key identifying the client the token belongs to
+        token: Token to save
+        expires: Unix time that the token expires
+    """
+    tokens = _read_token_file(token_file)
+    tokens[cache_key] = [dict(token), expires]
+    temp_file = f"{token_file}.tmp"
+    try:
+        token_dir = os.path.dirname(token_file)
+        if token_dir:
+            os.makedirs(token_dir, exist_ok=True)
+        with open(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as file:
+            file.write(orjson.dumps(tokens))
+        os.replace(temp_file, token_file)
+    except OSError as e:
+        warnings.warn(f"Could not save token to {token_file}: {e}")
+
+async def _get_json_async(
+        session: aiohttp.ClientSession,
+        url: str,
+        request_headers: dict[str, str],
+) -> tuple[dict, dict[str, str]] | None:
+    """Retrieves a json from the API using an async session
+
+    Args:
+        session: Session with authorization headers set, raising for error statuses
+        url: Full url of the API endpoint
+        request_headers: Conditional headers from a previously cached response
+
+    Returns:
+        The parsed json and the headers to revalidate it with, or None if the
+        cached response is still current
+    """
+    async with session.get(url, headers=request_headers) as response:
+        if response.status == 304:
+            return None
+        return orjson.loads(await response.read()), _conditional_headers(response.headers)
+
+def _get_static_json(
+        oauth: OAuth2Session,
+        url: str,
+) -> dict:
+    """Retrieves a json from a static API endpoint, shared between all callers for a day
+
+    Error responses raise rather than being cached
+
+    Args:
+        oauth: Session to make the request with
+        url: Full url of the API endpoint
+    """
+    cached = _static_json_cache.get(url)
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < STATIC_REFRESH_TIME:
+        return cached[1]
+    response = oauth.get(url)
+    response.raise_for_status()
+    json_data = orjson.loads(response.content)
+    _static_json_cache[url] = (now, json_data)
+    return json_data
+
+def _conditional_headers(
+        response_headers: Mapping[str, str]
+) -> dict[str, str]:
+    """Builds the headers for revalidating a response with a conditional request
+
+    Args:
+        response_headers: Headers of the original response
+    """
+    request_headers = {}
+    if "ETag" in response_headers:
+        request_headers["If-None-Match"] = response_headers["ETag"]
+    if "Last-Modified" in response_headers:
+        request_headers["If-Modified-Since"] = response_headers["Last-Modified"]
+    return request_headers
+
+def _mount_pooled_adapter(
+        oauth: OAuth2Session
+) -> OAuth2Session:
+    """Mounts a connection pooling adapter with retries for https requests on the session
+
+    Sessions which already have the adapter mounted are left as they are
+
+    Args:
+        oauth: Session to configure
+
+    Returns:
+        The same session, for convenience
+    """
+    if isinstance(oauth.adapters.get("https://"), _PooledAdapter):
+        return oauth
+    retries = Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF, status_forcelist=RETRY_STATUSES)
+    adapter = _PooledAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retries
+    )
+    oauth.mount("https://", adapter)
+    return oauth
 
 def _replace_quality_icons(
         enchants_dict: dict[str, str]
@@ -853,14 +1429,16 @@ def _replace_quality_icons(
     """Replaces the quality icons as they show up in the json response with
     the discord quality icon emotes in the No Pressure server
     """
-    replacements = {
-        "|A:Professions-ChatIcon-Quality-Tier3:20:20|a": ":quality3:",
-        "|A:Professions-ChatIcon-Quality-Tier2:20:20|a": ":quality2:",
-        "|A:Professions-ChatIcon-Quality-Tier1:20:20|a": ":quality1:",
+    return {
+        slot: (
+            _QUALITY_ICON_RE.sub(_quality_icon_emote, item)
+            if QUALITY_ICON_PREFIX in item
+            else item
+        )
+        for slot, item in enchants_dict.items()
     }
-    new_dict = enchants_dict.copy()
-    for slot, item in enchants_dict.items():
-        for string, icon in replacements.items():
-            if string in item:
-                new_dict[slot] = item.replace(string, icon)
-    return new_dict
+
+def _quality_icon_emote(
+        match: re.Match
+) -> str:
+    return QUALITY_ICONS[match.group(0)]